@@ -2,6 +2,8 @@
 TLD 综合功能测试脚本
 ============================
 覆盖四大验证类别：功能验证、性能验证、兼容性验证、稳定性验证
+功能 / 兼容性 / 稳定性类别在线程池中并发执行，性能类别串行执行；
+每个测试写入 DOWNLOAD_DIR 下以测试函数命名的独立子目录
 
 用法:
     1. 先启动本地测试服务器: python3 test_server.py
@@ -13,21 +15,28 @@ TLD 综合功能测试脚本
     - TLD_interface.py 在同一目录
 """
 
+import atexit
+import functools
 import hashlib
 import json
-import os # pyright: ignore[reportUnusedImport]
+import os
 import sys
 import time
 import threading
 import traceback
 import resource
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+from array import array
 from pathlib import Path
 from datetime import datetime
 from typing import Any
+from collections.abc import Callable
 
 # 添加同目录到 path
 sys.path.insert(0, str(Path(__file__).parent))
 from tld_interface import TLDownloader, EventLogger # pyright: ignore[reportUnusedImport]
+from test_server import SERVER_CPUS  # Linux 下留给测试服务器的 CPU，测试进程避开这些核心
 
 # ──────────────────────────────────────────────────────────────────
 # 配置
@@ -42,6 +51,10 @@ DLL_PATH = Path("/home/amd/TTSD/libTLD.so")
 DOWNLOAD_DIR = Path("/home/amd/TTSD/test_downloads")
 MANIFEST_PATH = Path("/home/amd/TTSD/test_files/manifest.json")
 
+# 进程内共享的下载器，除生命周期测试外所有测试复用，避免反复加载动态库
+_SHARED_DL: TLDownloader | None = None
+_SHARED_DL_LOCK = threading.Lock()
+
 # ──────────────────────────────────────────────────────────────────
 # 工具
 # ──────────────────────────────────────────────────────────────────
@@ -56,94 +69,200 @@ class Colors:
 
 def md5_file(filepath: str) -> str:
     """计算文件 MD5"""
-    h = hashlib.md5()
     with open(filepath, "rb") as f:
-        while chunk := f.read(8192):
-            h.update(chunk)
-    return h.hexdigest()
+        return hashlib.file_digest(f, "md5").hexdigest()
 
 def clean_download_dir():
-    """清空下载目录"""
+    """清空下载目录（整体删除后重建，而不是逐个文件 unlink）"""
+    try:
+        shutil.rmtree(DOWNLOAD_DIR)
+    except FileNotFoundError:
+        pass
     DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    for f in DOWNLOAD_DIR.iterdir():
-        if f.is_file():
-            f.unlink()
 
+def _rss_kb() -> int:
+    """当前进程常驻内存 (KB)。
+
+    Linux 下读取 /proc/self/statm 的第二列（页数）；其他平台没有该文件，
+    回退到 resource.getrusage 的峰值 ru_maxrss（macOS 单位为字节）"""
+    if sys.platform == "linux":
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    maxrss = int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) # pyright: ignore[reportUnknownArgumentType, reportAttributeAccessIssue, reportUnknownMemberType]
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+@functools.cache
 def load_manifest() -> dict[str, dict[str, str | int]]:
-    """加载测试文件 manifest"""
+    """加载测试文件 manifest（每个进程只解析一次）"""
     with open(MANIFEST_PATH) as f:
         return json.load(f)
 
+def _paths(base: Path, *files: str, prefix: str = "") -> tuple[list[str], list[str]]:
+    """返回测试文件对应的 (URL 列表, base 下的保存路径列表)"""
+    urls = [f"{LOCAL_BASE_URL}/{f}" for f in files]
+    save_paths = [str(base / f"{prefix}{f}") for f in files]
+    return urls, save_paths
+
+def pin_client_cpus():
+    """Linux 下将测试进程（含之后创建的下载器工作线程）固定到服务器以外的核心"""
+    if sys.platform != "linux":
+        return
+    cpus = os.sched_getaffinity(0) - SERVER_CPUS
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+def get_shared_dl() -> TLDownloader:
+    """返回共享下载器，首次调用时创建并注册退出时清理"""
+    global _SHARED_DL
+    with _SHARED_DL_LOCK:
+        if _SHARED_DL is None:
+            _SHARED_DL = TLDownloader(DLL_PATH)
+            atexit.register(_SHARED_DL.close)
+        return _SHARED_DL
+
+# 报告输出先缓存在 _OUT 中，每个分类结束时一次性写出，减少 stdout 写入次数
+_OUT: list[str] = []
+
+def _flush():
+    """将缓存的报告行一次性写到 stdout"""
+    if not _OUT:
+        return
+    lines = _OUT[:]
+    del _OUT[:len(lines)]
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+atexit.register(_flush)  # 异常退出时也输出已缓存的报告
+
+# run_one_test 在当前线程设置 lines 后，print_result 写入该列表而不是 _OUT，
+# 由 run_tests 按声明顺序汇总
+_TEST_OUT = threading.local()
+
 def print_header(title: str):
-    print(f"\n{'='*70}")
-    print(f"  {Colors.BOLD}{Colors.CYAN}{title}{Colors.RESET}")
-    print(f"{'='*70}")
+    _flush()
+    _OUT.append(f"\n{'='*70}")
+    _OUT.append(f"  {Colors.BOLD}{Colors.CYAN}{title}{Colors.RESET}")
+    _OUT.append(f"{'='*70}")
 
 def print_result(name: str, passed: bool, detail: str = ""):
     icon = f"{Colors.GREEN}✅ PASS{Colors.RESET}" if passed else f"{Colors.RED}❌ FAIL{Colors.RESET}"
     det = f" — {detail}" if detail else ""
-    print(f"  {icon}  {name}{det}")
+    getattr(_TEST_OUT, "lines", _OUT).append(f"  {icon}  {name}{det}")
 
 # ──────────────────────────────────────────────────────────────────
 # 事件收集器（用于测试回调的正确性）
 # ──────────────────────────────────────────────────────────────────
 
+class RawEvent:
+    """单条原始回调事件；使用 __slots__，不为每个事件分配实例 dict"""
+    __slots__ = ("event", "msg")
+
+    def __init__(self, event: dict[str, Any], msg: dict[str, Any]):
+        self.event = event
+        self.msg = msg
+
 class EventCollector:
-    """收集所有回调事件，供测试断言使用"""
-    def __init__(self):
-        self.events: list[dict[str, Any]] = []
-        self.done = threading.Event()
+    """收集所有回调事件，供测试断言使用
+
+    最近的事件类型存放在预分配的环形缓冲区中，回调只做下标写入，不为每个事件分配 dict；
+    超过 EVENT_CAPACITY 后覆盖最旧的事件。出现过的事件类型另存于 seen_event_types，
+    不受覆盖影响。只有 capture_times=True 时才记录首个事件与首个 update 的 perf_counter_ns 时间戳。
+    """
+    EVENT_CAPACITY = 1 << 12
+
+    def __init__(self, capture_times: bool = False):
+        cap = self.EVENT_CAPACITY
+        self._types: list[str | None] = [None] * cap
+        self._capture_times = capture_times
+        self._first_event_ns: int | None = None
+        self._first_update_ns: int | None = None
+        self._count = 0
+        self.seen_event_types: set[str] = set()
+        self._lock = threading.Lock()
+        self._end_sem = threading.Semaphore(0)
+        self.finished = False
         self.errors: list[dict[str, Any]] = []
-        self.start_time: float = time.time()
-        self.first_update_time: float | None = None
+        self.start_time: float = time.perf_counter()
 
     def __call__(self, event: dict[str, Any], msg: dict[str, Any]) -> None:
         event_type: str = event.get("event_type", event.get("Type", "?"))
-        self.events.append({"event": event, "msg": msg, "time": time.time()})
-
-        if event_type == "update" and self.first_update_time is None:
-            self.first_update_time = time.time()
+        with self._lock:
+            i = self._count & (self.EVENT_CAPACITY - 1)
+            self._types[i] = event_type
+            self.seen_event_types.add(event_type)
+            if self._capture_times:
+                t = time.perf_counter_ns()
+                if self._first_event_ns is None:
+                    self._first_event_ns = t
+                if event_type == "update" and self._first_update_ns is None:
+                    self._first_update_ns = t
+            self._count += 1
 
         if event_type == "end":
-            self.done.set()
+            self.finished = True
+            self._end_sem.release()
         elif event_type == "err":
             self.errors.append(msg)
 
-    def wait(self, timeout: int=30):
-        return self.done.wait(timeout=timeout)
+    def wait(self, timeout: float=30) -> bool:
+        """阻塞直到收到 end 事件或超时；end 到达时立即唤醒"""
+        if not self._end_sem.acquire(timeout=timeout):
+            return False
+        # 归还信号量，使之后的 wait 调用也立即返回
+        self._end_sem.release()
+        return True
 
     def get_event_types(self) -> list[str]:
-        return [e["event"].get("event_type", e["event"].get("Type", "?")) for e in self.events]
+        """按到达顺序返回环形缓冲区中保留的最近 EVENT_CAPACITY 个事件类型。
+        事件更多时最早的（如 start）已被覆盖；判断某类事件是否出现过请用 seen_event_types"""
+        with self._lock:
+            if self._count <= self.EVENT_CAPACITY:
+                return self._types[:self._count]  # pyright: ignore[reportReturnType]
+            i = self._count & (self.EVENT_CAPACITY - 1)
+            return self._types[i:] + self._types[:i]  # pyright: ignore[reportReturnType]
+
+    @property
+    def first_update_time(self) -> float | None:
+        """首个 update 事件的 perf_counter 时间（秒），未记录时间戳时为 None"""
+        if self._first_update_ns is None:
+            return None
+        return self._first_update_ns / 1e9
+
+    @property
+    def first_event_time(self) -> float | None:
+        """首个事件的 perf_counter 时间（秒），未记录时间戳时为 None"""
+        if self._first_event_ns is None:
+            return None
+        return self._first_event_ns / 1e9
 
     @property
     def elapsed(self) -> float:
-        return time.time() - self.start_time
+        return time.perf_counter() - self.start_time
 
 # ──────────────────────────────────────────────────────────────────
 # 一、功能验证
 # ──────────────────────────────────────────────────────────────────
 
-def test_single_file_download_md5():
+def test_single_file_download_md5(scratch_dir: Path):
     """测试 1: 单文件下载 + MD5 校验"""
-    clean_download_dir()
     manifest = load_manifest()
 
     filename = "medium_1mb.bin"
     url = f"{LOCAL_BASE_URL}/{filename}"
-    save_path = str(DOWNLOAD_DIR / filename)
+    save_path = str(scratch_dir / filename)
     expected_md5: str = manifest[filename]["md5"] # pyright: ignore[reportAssignmentType]
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download(
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=4,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        assert dl_id > 0, f"start_download 返回 {dl_id}"
-        collector.wait(timeout=30)
+    dl = get_shared_dl()
+    dl_id = dl.start_download(
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=4,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    assert dl_id > 0, f"start_download 返回 {dl_id}"
+    collector.wait(timeout=30)
 
     actual_md5 = md5_file(save_path)
     passed = (actual_md5 == expected_md5)
@@ -152,30 +271,28 @@ def test_single_file_download_md5():
     return passed
 
 
-def test_multi_file_sequential():
+def test_multi_file_sequential(scratch_dir: Path):
     """测试 2: 多文件顺序下载"""
-    clean_download_dir()
     manifest = load_manifest()
 
     files = ["tiny_1kb.bin", "small_100kb.bin", "medium_1mb.bin"]
-    urls = [f"{LOCAL_BASE_URL}/{f}" for f in files]
-    save_paths = [str(DOWNLOAD_DIR / f) for f in files]
+    urls, save_paths = _paths(scratch_dir, *files)
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download(
-            urls=urls,
-            save_paths=save_paths,
-            thread_count=4,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        assert dl_id > 0
-        collector.wait(timeout=60)
+    dl = get_shared_dl()
+    dl_id = dl.start_download(
+        urls=urls,
+        save_paths=save_paths,
+        thread_count=4,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    assert dl_id > 0
+    collector.wait(timeout=60)
 
     all_correct = True
     for filename in files:
-        filepath = DOWNLOAD_DIR / filename
+        filepath = scratch_dir / filename
         if not filepath.exists():
             all_correct = False
             continue
@@ -188,34 +305,35 @@ def test_multi_file_sequential():
     return all_correct
 
 
-def test_callback_events():
+def test_callback_events(scratch_dir: Path):
     """测试 3: 回调事件完整性"""
-    clean_download_dir()
-
-    url = f"{LOCAL_BASE_URL}/small_100kb.bin"
-    save_path = str(DOWNLOAD_DIR / "callback_test.bin")
+    url = f"{LOCAL_BASE_URL}/tiny_1kb.bin"
+    save_path = str(scratch_dir / "callback_test.bin")
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        collector.wait(timeout=15)
-
-    event_types = collector.get_event_types()
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    collector.wait(timeout=15)
+
+    event_types = collector.seen_event_types
     has_start = "start" in event_types
     has_start_one = "startOne" in event_types
     has_end_one = "endOne" in event_types
     has_end = "end" in event_types
+    # 1KB 文件的事件数远小于 EVENT_CAPACITY，环形缓冲区保留了完整的到达顺序
+    ordered = collector.get_event_types()
+    in_order = bool(ordered) and ordered[0] == "start" and ordered[-1] == "end"
 
-    passed = has_start and has_end
+    passed = has_start and has_end and in_order
     detail_parts: list[str] = []
     for name, val in [("start", has_start), ("startOne", has_start_one),
-                       ("endOne", has_end_one), ("end", has_end)]:
+                       ("endOne", has_end_one), ("end", has_end), ("顺序", in_order)]:
         icon = "✓" if val else "✗"
         detail_parts.append(f"{name}={icon}")
 
@@ -223,23 +341,21 @@ def test_callback_events():
     return passed
 
 
-def test_error_handling_404():
+def test_error_handling_404(scratch_dir: Path):
     """测试 4: 错误处理 - 404 URL"""
-    clean_download_dir()
-
     url = f"{LOCAL_BASE_URL}/nonexistent_file.bin"
-    save_path = str(DOWNLOAD_DIR / "should_not_exist.bin")
+    save_path = str(scratch_dir / "should_not_exist.bin")
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        collector.wait(timeout=15)
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    collector.wait(timeout=15)
 
     has_error = len(collector.errors) > 0
 
@@ -248,32 +364,29 @@ def test_error_handling_404():
     return has_error
 
 
-def test_get_downloader_then_start():
+def test_get_downloader_then_start(scratch_dir: Path):
     """测试 5: 先创建后启动"""
-    clean_download_dir()
-    manifest = load_manifest() # pyright: ignore[reportUnusedVariable]
-
     url = f"{LOCAL_BASE_URL}/small_100kb.bin"
-    save_path = str(DOWNLOAD_DIR / "deferred_start.bin")
+    save_path = str(scratch_dir / "deferred_start.bin")
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.get_downloader(
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        assert dl_id > 0, f"get_downloader 返回 {dl_id}"
-
-        # 稍等再启动
-        time.sleep(0.5)
-        ok = dl.start_download_by_id(dl_id)
-        assert ok, "start_download_by_id 返回 False"
-        collector.wait(timeout=15)
-
-    filepath = DOWNLOAD_DIR / "deferred_start.bin"
+    dl = get_shared_dl()
+    dl_id = dl.get_downloader(
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    assert dl_id > 0, f"get_downloader 返回 {dl_id}"
+
+    # 稍等再启动
+    time.sleep(0.5)
+    ok = dl.start_download_by_id(dl_id)
+    assert ok, "start_download_by_id 返回 False"
+    collector.wait(timeout=15)
+
+    filepath = scratch_dir / "deferred_start.bin"
     exists = filepath.exists() and filepath.stat().st_size > 0
     print_result("创建后启动 (get_downloader + start_by_id)", exists,
                  f"文件大小: {filepath.stat().st_size if exists else 0} bytes")
@@ -284,25 +397,23 @@ def test_get_downloader_then_start():
 # 二、性能验证
 # ──────────────────────────────────────────────────────────────────
 
-def test_throughput_local():
+def test_throughput_local(scratch_dir: Path):
     """测试 6: 本地服务器吞吐量测试 (10MB)"""
-    clean_download_dir()
-
     url = f"{LOCAL_BASE_URL}/large_10mb.bin"
-    save_path = str(DOWNLOAD_DIR / "throughput_test.bin")
+    save_path = str(scratch_dir / "throughput_test.bin")
 
     collector = EventCollector()
     start_time = time.time()
 
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=8,
-            chunk_size_mb=2,
-            callback=collector,
-        )
-        collector.wait(timeout=60)
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=8,
+        chunk_size_mb=2,
+        callback=collector,
+    )
+    collector.wait(timeout=60)
 
     elapsed = time.time() - start_time
     file_size = Path(save_path).stat().st_size if Path(save_path).exists() else 0
@@ -314,29 +425,37 @@ def test_throughput_local():
     return passed
 
 
-def test_memory_usage() -> bool:
-    """测试 7: 内存占用监控"""
-    clean_download_dir()
+def test_memory_usage(scratch_dir: Path) -> bool:
+    """测试 7: 内存占用监控（下载期间每 50ms 采样当前 RSS）"""
+    files = ["medium_1mb.bin", "large_10mb.bin"]
+    urls, save_paths = _paths(scratch_dir, *files, prefix="mem_")
 
-    # 测量 baseline
-    baseline_rss: int = int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) # pyright: ignore[reportUnknownArgumentType, reportAttributeAccessIssue, reportUnknownMemberType]
+    samples = array("L")
+    stop = threading.Event()
 
-    files = ["medium_1mb.bin", "large_10mb.bin"]
-    urls = [f"{LOCAL_BASE_URL}/{f}" for f in files]
-    save_paths = [str(DOWNLOAD_DIR / f"mem_{f}") for f in files]
+    def sample_rss():
+        while not stop.wait(0.05):
+            samples.append(_rss_kb())
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=urls,
-            save_paths=save_paths,
-            thread_count=8,
-            chunk_size_mb=2,
-            callback=collector,
-        )
-        collector.wait(timeout=60)
-
-    peak_rss: int = int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) # pyright: ignore[reportUnknownArgumentType, reportAttributeAccessIssue, reportUnknownMemberType]
+    dl = get_shared_dl()
+    # 测量 baseline（当前 RSS，而非进程生命周期内的峰值 ru_maxrss）
+    baseline_rss = _rss_kb()
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=urls,
+        save_paths=save_paths,
+        thread_count=8,
+        chunk_size_mb=2,
+        callback=collector,
+    )
+    collector.wait(timeout=60)
+    stop.set()
+    sampler.join()
+    samples.append(_rss_kb())
+
+    peak_rss = max(samples)
     delta_mb = (peak_rss - baseline_rss) / 1024  # KB -> MB
 
     passed = delta_mb < 200  # 内存增量应 < 200MB
@@ -345,31 +464,29 @@ def test_memory_usage() -> bool:
     return passed
 
 
-def test_startup_latency():
+def test_startup_latency(scratch_dir: Path):
     """测试 8: 启动延迟（调用到首次回调的时间）"""
-    clean_download_dir()
+    url = f"{LOCAL_BASE_URL}/tiny_1kb.bin"
+    save_path = str(scratch_dir / "latency_test.bin")
 
-    url = f"{LOCAL_BASE_URL}/small_100kb.bin"
-    save_path = str(DOWNLOAD_DIR / "latency_test.bin")
+    collector = EventCollector(capture_times=True)
+    call_time = time.perf_counter()
 
-    collector = EventCollector()
-    call_time = time.time()
-
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        collector.wait(timeout=15)
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    collector.wait(timeout=15)
 
     latency_ms = (collector.first_update_time - call_time) * 1000 if collector.first_update_time else -1
     if latency_ms < 0:
         # 可能没有 update 事件，用第一个事件替代
-        if collector.events:
-            latency_ms = (collector.events[0]["time"] - call_time) * 1000
+        if collector.first_event_time is not None:
+            latency_ms = (collector.first_event_time - call_time) * 1000
 
     passed = 0 < latency_ms < 5000  # 应在 5 秒内收到首个回调
     print_result("启动延迟", passed,
@@ -381,23 +498,21 @@ def test_startup_latency():
 # 三、兼容性验证
 # ──────────────────────────────────────────────────────────────────
 
-def test_public_server_download():
+def test_public_server_download(scratch_dir: Path):
     """测试 9: 公网下载服务器兼容性 (thinkbroadband 5MB)"""
-    clean_download_dir()
-
     url = PUBLIC_TEST_URLS["5mb"]
-    save_path = str(DOWNLOAD_DIR / "public_5mb.zip")
+    save_path = str(scratch_dir / "public_5mb.zip")
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=4,
-            chunk_size_mb=2,
-            callback=collector,
-        )
-        collector.wait(timeout=120)
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=4,
+        chunk_size_mb=2,
+        callback=collector,
+    )
+    collector.wait(timeout=120)
 
     file_exists = Path(save_path).exists()
     file_size = Path(save_path).stat().st_size if file_exists else 0
@@ -410,33 +525,31 @@ def test_public_server_download():
     return passed
 
 
-def test_callback_json_format():
+def test_callback_json_format(scratch_dir: Path):
     """测试 10: 回调 JSON 格式正确性"""
-    clean_download_dir()
-
     url = f"{LOCAL_BASE_URL}/tiny_1kb.bin"
-    save_path = str(DOWNLOAD_DIR / "json_test.bin")
+    save_path = str(scratch_dir / "json_test.bin")
 
-    raw_events: list[dict[str, Any]] = []
+    raw_events: list[RawEvent] = []
 
     def raw_callback(event: dict[str, Any], msg: dict[str, Any]):
-        raw_events.append({"event": event, "msg": msg})
-
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=raw_callback,
-        )
-        time.sleep(5)
+        raw_events.append(RawEvent(event, msg))
+
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=raw_callback,
+    )
+    time.sleep(5)
 
     # 检查 event 字段
     valid = True
     issues: list[str] = []
     for entry in raw_events:
-        ev: dict[str, Any] | Any = entry["event"]
+        ev: dict[str, Any] | Any = entry.event
         if not isinstance(ev, dict):
             valid = False
             issues.append("event 不是 dict")
@@ -453,16 +566,14 @@ def test_callback_json_format():
 # 四、稳定性验证
 # ──────────────────────────────────────────────────────────────────
 
-def test_repeated_create_destroy():
+def test_repeated_create_destroy(scratch_dir: Path):
     """测试 11: 反复创建/销毁下载器"""
-    clean_download_dir()
-
     url = f"{LOCAL_BASE_URL}/tiny_1kb.bin"
     iterations = 10
     success_count = 0
 
     for i in range(iterations):
-        save_path = str(DOWNLOAD_DIR / f"repeat_{i}.bin")
+        save_path = str(scratch_dir / f"repeat_{i}.bin")
         collector = EventCollector()
         try:
             with TLDownloader(DLL_PATH) as dl:
@@ -485,23 +596,21 @@ def test_repeated_create_destroy():
     return passed
 
 
-def test_unicode_filename():
+def test_unicode_filename(scratch_dir: Path):
     """测试 12: Unicode 文件名"""
-    clean_download_dir()
-
     url = f"{LOCAL_BASE_URL}/tiny_1kb.bin"
-    save_path = str(DOWNLOAD_DIR / "下载测试_文件名.bin")
+    save_path = str(scratch_dir / "下载测试_文件名.bin")
 
     collector = EventCollector()
-    with TLDownloader(DLL_PATH) as dl:
-        dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
-            urls=[url],
-            save_paths=[save_path],
-            thread_count=2,
-            chunk_size_mb=1,
-            callback=collector,
-        )
-        collector.wait(timeout=15)
+    dl = get_shared_dl()
+    dl_id = dl.start_download( # pyright: ignore[reportUnusedVariable]
+        urls=[url],
+        save_paths=[save_path],
+        thread_count=2,
+        chunk_size_mb=1,
+        callback=collector,
+    )
+    collector.wait(timeout=15)
 
     exists = Path(save_path).exists() and Path(save_path).stat().st_size > 0
     print_result("Unicode 文件名", exists,
@@ -509,54 +618,92 @@ def test_unicode_filename():
     return exists
 
 
-def test_concurrent_multiple_downloaders():
-    """测试 13: 并发多个独立下载器"""
-    clean_download_dir()
+def test_concurrent_multi_file_download(scratch_dir: Path):
+    """测试 13: 单下载器并行下载多个文件（is_multiple=True，实验性并行模式）"""
+    manifest = load_manifest()
 
     files: list[str] = ["tiny_1kb.bin", "small_100kb.bin", "medium_1mb.bin"]
-    collectors: list[EventCollector] = []
-    threads: list[threading.Thread] = []
+    urls, save_paths = _paths(scratch_dir, *files, prefix="concurrent_")
 
-    def download_one(filename: str, idx: int):
-        url = f"{LOCAL_BASE_URL}/{filename}"
-        save_path = str(DOWNLOAD_DIR / f"concurrent_{idx}_{filename}")
-        collector = EventCollector()
-        collectors.append(collector)
-        with TLDownloader(DLL_PATH) as dl:
-            dl.start_download( # pyright: ignore[reportUnusedVariable]
-                urls=[url],
-                save_paths=[save_path],
-                thread_count=2,
-                chunk_size_mb=1,
-                callback=collector,
-            )
-            collector.wait(timeout=30)
-
-    for i, f in enumerate(files):
-        t = threading.Thread(target=download_one, args=(f, i))
-        threads.append(t)
-        t.start()
-
-    for t in threads:
-        t.join(timeout=30)
-
-    all_done = all(c.done.is_set() for c in collectors)
-    downloaded_count = sum(1 for c in collectors if c.done.is_set())
-    print_result("并发多下载器 (3 同时)", all_done,
+    collector = EventCollector()
+    dl = get_shared_dl()
+    dl_id = dl.start_download(
+        urls=urls,
+        save_paths=save_paths,
+        thread_count=6,
+        chunk_size_mb=1,
+        callback=collector,
+        is_multiple=True,
+    )
+    assert dl_id > 0, f"start_download 返回 {dl_id}"
+    collector.wait(timeout=30)
+
+    # 原生端创建文件时即预设为完整大小，因此用 MD5 而不是文件存在与否判断完成
+    downloaded_count = sum(
+        1 for filename, save_path in zip(files, save_paths)
+        if Path(save_path).exists() and md5_file(save_path) == manifest[filename]["md5"]
+    )
+    all_done = collector.finished and downloaded_count == len(files)
+    print_result("并发多文件下载 (3 同时)", all_done,
                  f"完成: {downloaded_count}/{len(files)}")
     return all_done
 
 
+# ──────────────────────────────────────────────────────────────────
+# 测试调度
+# ──────────────────────────────────────────────────────────────────
+
+TestFunc = Callable[[Path], bool]
+
+def run_one_test(name: str, func: TestFunc) -> tuple[bool, list[str]]:
+    """在独立的下载子目录中运行单个测试，异常视为失败。
+    返回测试结果与该测试输出的报告行（结果行及异常 traceback）"""
+    scratch_dir = DOWNLOAD_DIR / func.__name__
+    scratch_dir.mkdir(parents=True, exist_ok=True)
+    lines: list[str] = []
+    _TEST_OUT.lines = lines
+    try:
+        return func(scratch_dir), lines
+    except Exception as e:
+        # traceback 与结果行作为同一条记录输出，保证它紧跟在所属结果行之后
+        trace = traceback.format_exc().rstrip("\n")
+        print_result(name, False, f"异常: {e}\n{trace}")
+        return False, lines
+    finally:
+        del _TEST_OUT.lines
+
+def run_tests(tests: list[tuple[str, TestFunc]], parallel: bool) -> dict[str, bool]:
+    """运行一组测试；parallel=True 时用线程池并发执行。
+    结果与报告行都按声明顺序写入，与完成顺序无关"""
+    if not parallel:
+        outcomes = [(name, run_one_test(name, func)) for name, func in tests]
+    else:
+        # 按实际可用的 CPU 数（受 pin_client_cpus 设置的亲和性限制）决定线程数
+        if hasattr(os, "sched_getaffinity"):
+            workers = len(os.sched_getaffinity(0))
+        else:
+            workers = os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(name, pool.submit(run_one_test, name, func)) for name, func in tests]
+            outcomes = [(name, fut.result()) for name, fut in futures]
+    results: dict[str, bool] = {}
+    for name, (passed, lines) in outcomes:
+        _OUT.extend(lines)
+        results[name] = passed
+    return results
+
 # ──────────────────────────────────────────────────────────────────
 # 主入口
 # ──────────────────────────────────────────────────────────────────
 
 def main():
-    print(f"\n{'#'*70}")
-    print(f"#{' '*17}TLD 综合测试报告{' '*17}#")
-    print(f"#{' '*15}{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{' '*22}#")
-    print(f"{'#'*70}")
+    pin_client_cpus()
+    _OUT.append(f"\n{'#'*70}")
+    _OUT.append(f"#{' '*17}TLD 综合测试报告{' '*17}#")
+    _OUT.append(f"#{' '*15}{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{' '*22}#")
+    _OUT.append(f"{'#'*70}")
 
+    clean_download_dir()
     results: dict[str, bool] = {}
 
     # ── 一、功能验证 ──
@@ -569,15 +716,9 @@ def main():
         ("创建后启动", test_get_downloader_then_start),
     ]
 
-    for name, func in tests_functional:
-        try:
-            results[name] = func()
-        except Exception as e:
-            results[name] = False
-            print_result(name, False, f"异常: {e}")
-            traceback.print_exc()
+    results.update(run_tests(tests_functional, parallel=True))
 
-    # ── 二、性能验证 ──
+    # ── 二、性能验证（串行执行，避免相互干扰测量结果） ──
     print_header("二、性能验证")
     tests_performance = [
         ("本地吞吐量", test_throughput_local),
@@ -585,13 +726,7 @@ def main():
         ("启动延迟", test_startup_latency),
     ]
 
-    for name, func in tests_performance:
-        try:
-            results[name] = func()
-        except Exception as e:
-            results[name] = False
-            print_result(name, False, f"异常: {e}")
-            traceback.print_exc()
+    results.update(run_tests(tests_performance, parallel=False))
 
     # ── 三、兼容性验证 ──
     print_header("三、兼容性验证")
@@ -600,29 +735,17 @@ def main():
         ("回调JSON格式", test_callback_json_format),
     ]
 
-    for name, func in tests_compat:
-        try:
-            results[name] = func()
-        except Exception as e:
-            results[name] = False
-            print_result(name, False, f"异常: {e}")
-            traceback.print_exc()
+    results.update(run_tests(tests_compat, parallel=True))
 
     # ── 四、稳定性验证 ──
     print_header("四、稳定性验证")
     tests_stability = [
         ("反复创建销毁", test_repeated_create_destroy),
         ("Unicode文件名", test_unicode_filename),
-        ("并发多下载器", test_concurrent_multiple_downloaders),
+        ("并发多文件下载", test_concurrent_multi_file_download),
     ]
 
-    for name, func in tests_stability:
-        try:
-            results[name] = func()
-        except Exception as e:
-            results[name] = False
-            print_result(name, False, f"异常: {e}")
-            traceback.print_exc()
+    results.update(run_tests(tests_stability, parallel=True))
 
     # ── 汇总 ──
     print_header("测试汇总")
@@ -632,12 +755,13 @@ def main():
 
     for name, ok in results.items():
         status = f"{Colors.GREEN}PASS{Colors.RESET}" if ok else f"{Colors.RED}FAIL{Colors.RESET}"
-        print(f"  [{status}] {name}")
+        _OUT.append(f"  [{status}] {name}")
 
-    print(f"\n  {'='*50}")
+    _OUT.append(f"\n  {'='*50}")
     color = Colors.GREEN if failed == 0 else Colors.RED
-    print(f"  {Colors.BOLD}{color}通过: {passed}/{total}, 失败: {failed}/{total}{Colors.RESET}")
-    print(f"  {'='*50}\n")
+    _OUT.append(f"  {Colors.BOLD}{color}通过: {passed}/{total}, 失败: {failed}/{total}{Colors.RESET}")
+    _OUT.append(f"  {'='*50}\n")
+    _flush()
 
     return 0 if failed == 0 else 1
 
@@ -3,20 +3,37 @@ TLD Next 本地测试 HTTP 服务器
 - 支持 Range 请求（分块下载）
 - 支持 HEAD 请求（获取文件大小）
 - 支持 Content-Length 头
+- 多线程处理并发请求
 - 自动生成测试文件
 """
 
-import os # pyright: ignore[reportUnusedImport]
-import sys # pyright: ignore[reportUnusedImport]
+import os
+import sys
+import errno
 import hashlib
 import json
-import threading # pyright: ignore[reportUnusedImport]
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import mmap
+import queue
+import re
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from pathlib import Path
 from typing import Any
 
 TEST_DIR = Path(__file__).parent / "test_files"
 SERVER_PORT = 18080
+# Linux 下服务器固定运行的 CPU，其余核心留给测试进程（见 test_comprehensive.py）
+SERVER_CPUS = {0, 1}
+
+# 启动时 mmap 的测试文件缓存：文件名 -> 只读 memoryview
+FILE_CACHE: dict[str, memoryview] = {}
+# 不小于该大小的文件按随机访问提示内核，避免 Range 请求触发大量预读
+MADV_RANDOM_THRESHOLD = 64 * 1024 * 1024
+# Range 头格式：bytes=start-[end]
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)", re.ASCII)
+# 请求日志队列：处理线程只入队，由单独的日志线程写 stdout
+LOG_QUEUE: queue.Queue[str] = queue.Queue()
 
 # ─── 测试文件生成 ───────────────────────────────────────────────
 
@@ -38,10 +55,8 @@ def generate_test_files() -> dict[str, dict[str, str | int]]:
         filepath = TEST_DIR / name
         if filepath.exists() and filepath.stat().st_size == size:
             # 已存在且大小正确，只计算 MD5
-            md5 = hashlib.md5()
             with open(filepath, "rb") as f:
-                while chunk := f.read(8192):
-                    md5.update(chunk)
+                md5 = hashlib.file_digest(f, "md5")
             manifest[name] = {"size": size, "md5": md5.hexdigest()}
             print(f"  [已存在] {name} ({size:,} bytes) MD5={manifest[name]['md5']}")
             continue
@@ -50,14 +65,15 @@ def generate_test_files() -> dict[str, dict[str, str | int]]:
         # 用文件名 + 偏移量生成可预测的内容
         md5 = hashlib.md5()
         pattern = (name * 256)[:256].encode("utf-8")  # 256 字节的重复模式
+        # 预先平铺成约 1MB 的块，按块写入而不是逐 256 字节循环
+        block = memoryview(pattern * ((1 << 20) // len(pattern)))
         with open(filepath, "wb") as f:
-            written = 0
-            while written < size:
-                chunk_size = min(len(pattern), size - written)
-                chunk = pattern[:chunk_size]
+            remaining = size
+            while remaining > 0:
+                chunk = block[:min(len(block), remaining)]
                 f.write(chunk)
                 md5.update(chunk)
-                written += chunk_size
+                remaining -= len(chunk)
 
         manifest[name] = {"size": size, "md5": md5.hexdigest()}
         print(f" OK  MD5={manifest[name]['md5']}")
@@ -71,20 +87,60 @@ def generate_test_files() -> dict[str, dict[str, str | int]]:
     return manifest
 
 
+def load_file_cache(manifest: dict[str, dict[str, str | int]]):
+    """将测试文件只读 mmap 进 FILE_CACHE，之后的请求无需再 open/fstat"""
+    for name, info in manifest.items():
+        if not info["size"]:
+            continue  # 空文件无法 mmap
+        fd = os.open(TEST_DIR / name, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)  # mmap 持有自己的句柄
+        if len(mm) >= MADV_RANDOM_THRESHOLD and hasattr(mmap, "MADV_RANDOM"):
+            mm.madvise(mmap.MADV_RANDOM)
+        FILE_CACHE[name] = memoryview(mm)
+
+
+def log_writer():
+    """日志线程：取出当前积压的全部日志行，合并为一次写入"""
+    while True:
+        lines = [LOG_QUEUE.get()]
+        try:
+            while True:
+                lines.append(LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            pass
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
 # ─── HTTP Handler（支持 Range） ─────────────────────────────────
 
 class RangeRequestHandler(BaseHTTPRequestHandler):
     """支持 Range 请求的 HTTP 文件服务器"""
 
+    # wfile 使用 1MB 写缓冲（默认无缓冲），回退读写路径的 64KB 块合并为约每 MB 一次 send；
+    # sendmsg / sendfile 路径在直接写 socket 前会先 flush
+    wbufsize = 1 << 20
+
+    def setup(self):
+        super().setup()
+        # 关闭 Nagle，减少小响应（响应头、小文件）的首字节延迟
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
     def log_message(self, format: str, *args: tuple[Any]):
-        """简化日志格式"""
-        print(f"  [{self.client_address[0]}] {format % args}")
+        """简化日志格式，交给日志线程输出"""
+        LOG_QUEUE.put(f"  [{self.client_address[0]}] {format % args}")
 
-    def _resolve_path(self):
-        """从 URL 解析文件路径"""
+    def _resolve_path(self) -> tuple[str, int] | None:
+        """从 URL 解析文件名与文件大小"""
         path = self.path.lstrip("/")
         if not path:
             return None
+        view = FILE_CACHE.get(path)
+        if view is not None:
+            return path, len(view)
         filepath = TEST_DIR / path
         if not filepath.exists() or not filepath.is_file():
             return None
@@ -93,16 +149,90 @@ class RangeRequestHandler(BaseHTTPRequestHandler):
             filepath.resolve().relative_to(TEST_DIR.resolve())
         except ValueError:
             return None
-        return filepath
+        return path, filepath.stat().st_size
+
+    def _get_view(self, name: str) -> memoryview | None:
+        """返回缓存的文件 memoryview，未缓存时返回 None"""
+        return FILE_CACHE.get(name)
+
+    def _sendmsg_all(self, buffers: list[memoryview]):
+        """用 sendmsg 分散/聚集写发送多个缓冲区，处理部分发送"""
+        bufs = [b for b in buffers if len(b)]
+        while bufs:
+            sent = self.request.sendmsg(bufs)
+            while sent:
+                if sent >= len(bufs[0]):
+                    sent -= len(bufs[0])
+                    bufs.pop(0)
+                else:
+                    bufs[0] = bufs[0][sent:]
+                    sent = 0
+
+    def _build_head(self, code: int, headers: list[tuple[str, str]]) -> bytes:
+        """记录请求日志并构造完整响应头（状态行 + 头部 + 空行）；HTTP/0.9 请求没有响应头"""
+        self.log_request(code)
+        if self.request_version == "HTTP/0.9":
+            return b""
+        lines = [
+            f"{self.protocol_version} {code} {self.responses[code][0]}",
+            f"Server: {self.version_string()}",
+            f"Date: {self.date_time_string()}",
+        ]
+        lines += [f"{key}: {value}" for key, value in headers]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    def _send_body(self, head: bytes, name: str, offset: int, count: int):
+        """发送响应头 head 与文件 [offset, offset+count) 区间。
+
+        缓存命中时响应头与 memoryview 合并为一次 sendmsg 发出；
+        否则优先 sendfile 零拷贝，不支持时回退到读写循环"""
+        view = self._get_view(name)
+        if view is not None:
+            if hasattr(self.request, "sendmsg"):
+                self.wfile.flush()
+                self._sendmsg_all([memoryview(head), view[offset:offset + count]])
+            else:
+                self.wfile.write(head)
+                self.wfile.write(view[offset:offset + count])
+            return
+
+        # 先把响应头推到 socket 上，再由内核直接发送文件内容
+        self.wfile.write(head)
+        self.wfile.flush()
+        fd = os.open(TEST_DIR / name, os.O_RDONLY)
+        try:
+            if hasattr(os, "sendfile"):
+                try:
+                    while count > 0:
+                        sent = os.sendfile(self.wfile.fileno(), fd, offset, count)
+                        if sent == 0:
+                            return
+                        offset += sent
+                        count -= sent
+                    return
+                except OSError as e:
+                    # EINVAL: 目标不支持 sendfile（如 TLS 包装），从当前位置回退
+                    if e.errno != errno.EINVAL:
+                        raise
+
+            os.lseek(fd, offset, os.SEEK_SET)
+            while count > 0:
+                chunk = os.read(fd, min(65536, count))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                count -= len(chunk)
+        finally:
+            os.close(fd)
 
     def do_HEAD(self):
         """处理 HEAD 请求（返回文件大小）"""
-        filepath = self._resolve_path()
-        if filepath is None:
+        resolved = self._resolve_path()
+        if resolved is None:
             self.send_error(404, "File not found")
             return
 
-        file_size = filepath.stat().st_size
+        _, file_size = resolved
         self.send_response(200)
         self.send_header("Content-Type", "application/octet-stream")
         self.send_header("Content-Length", str(file_size))
@@ -123,67 +253,58 @@ class RangeRequestHandler(BaseHTTPRequestHandler):
                 self.wfile.write(data)
                 return
 
-        filepath = self._resolve_path()
-        if filepath is None:
+        resolved = self._resolve_path()
+        if resolved is None:
             self.send_error(404, "File not found")
             return
 
-        file_size = filepath.stat().st_size
+        name, file_size = resolved
         range_header = self.headers.get("Range")
 
         if range_header:
-            # 解析 Range 头
-            try:
-                range_spec = range_header.replace("bytes=", "")
-                start_str, end_str = range_spec.split("-")
-                start = int(start_str)
-                end = int(end_str) if end_str else file_size - 1
-                end = min(end, file_size - 1)
-
-                if start >= file_size or start > end:
-                    self.send_error(416, "Range Not Satisfiable")
-                    return
-
-                content_length = end - start + 1
-                self.send_response(206)
-                self.send_header("Content-Type", "application/octet-stream")
-                self.send_header("Content-Length", str(content_length))
-                self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
-                self.send_header("Accept-Ranges", "bytes")
-                self.end_headers()
-
-                with open(filepath, "rb") as f:
-                    f.seek(start)
-                    remaining = content_length
-                    while remaining > 0:
-                        chunk_size = min(65536, remaining)
-                        chunk = f.read(chunk_size)
-                        if not chunk:
-                            break
-                        self.wfile.write(chunk)
-                        remaining -= len(chunk)
-
-            except (ValueError, IndexError):
+            # 解析 Range 头（仅支持单个 bytes=start-[end] 区间）
+            m = RANGE_RE.fullmatch(range_header)
+            if m is None:
                 self.send_error(400, "Bad Range header")
                 return
+            start = int(m.group(1))
+            end = min(int(m.group(2)), file_size - 1) if m.group(2) else file_size - 1
+
+            if start >= file_size or start > end:
+                self.send_error(416, "Range Not Satisfiable")
+                return
+
+            content_length = end - start + 1
+            head = self._build_head(206, [
+                ("Content-Type", "application/octet-stream"),
+                ("Content-Length", str(content_length)),
+                ("Content-Range", f"bytes {start}-{end}/{file_size}"),
+                ("Accept-Ranges", "bytes"),
+            ])
+            self._send_body(head, name, start, content_length)
         else:
             # 完整文件返回
-            self.send_response(200)
-            self.send_header("Content-Type", "application/octet-stream")
-            self.send_header("Content-Length", str(file_size))
-            self.send_header("Accept-Ranges", "bytes")
-            self.end_headers()
-
-            with open(filepath, "rb") as f:
-                while True:
-                    chunk = f.read(65536)
-                    if not chunk:
-                        break
-                    self.wfile.write(chunk)
+            head = self._build_head(200, [
+                ("Content-Type", "application/octet-stream"),
+                ("Content-Length", str(file_size)),
+                ("Accept-Ranges", "bytes"),
+            ])
+            self._send_body(head, name, 0, file_size)
 
 
 # ─── 主入口 ─────────────────────────────────────────────────────
 
+def pin_server_cpus():
+    """Linux 下将服务器固定到 SERVER_CPUS，避免与下载器线程争抢核心导致测速抖动。
+    之后创建的处理线程会继承该亲和性"""
+    if sys.platform != "linux":
+        return
+    allowed = os.sched_getaffinity(0)
+    cpus = SERVER_CPUS & allowed
+    if cpus and len(allowed) > len(cpus):
+        os.sched_setaffinity(0, cpus)
+
+
 def main():
     print("=" * 60)
     print("  TLD Next 本地测试 HTTP 服务器")
@@ -191,6 +312,7 @@ def main():
 
     print("\n📦 生成测试文件...")
     manifest = generate_test_files()
+    load_file_cache(manifest)
 
     print(f"\n🚀 启动 HTTP 服务器，端口 {SERVER_PORT}...")
     print(f"   地址: http://127.0.0.1:{SERVER_PORT}/")
@@ -200,7 +322,9 @@ def main():
         print(f"     - http://127.0.0.1:{SERVER_PORT}/{name}  ({info['size']:,} bytes)")
     print(f"\n   按 Ctrl+C 停止服务器\n")
 
-    server = HTTPServer(("0.0.0.0", SERVER_PORT), RangeRequestHandler)
+    pin_server_cpus()
+    threading.Thread(target=log_writer, name="log-writer", daemon=True).start()
+    server = ThreadingHTTPServer(("0.0.0.0", SERVER_PORT), RangeRequestHandler)
     try:
         server.serve_forever()
     except KeyboardInterrupt: